@@ -1,17 +1,29 @@
+import csv
 import logging
+import hashlib
 import textwrap
+import functools
+import threading
 import pandas as pd
 import google.generativeai as genai
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 
-from .utils import extract_json, ensure_columns_exist, convert_list_to_string
+from .utils import extract_json, ensure_columns_exist, convert_value_to_string, truncate_content, configure_logging
 from .scraper import get_text_content
-from .gemini_api import build_prompt, call_gemini
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+from .gemini_api import build_prompt, build_prompt_sections, call_gemini
 
+# JSON objects parsed from the responses to recently sent prompts keyed by prompt fingerprint (least
+# recently used first), and futures for the requests still in flight so identical concurrent prompts share
+# one call. Responses without valid JSON are never cached, so the prompt is sent again for the next row.
+RESPONSE_CACHE_SIZE = 1024
+_response_cache = OrderedDict()
+_pending_responses = {}
+_response_lock = threading.Lock()
 
-def enrich_table(csv_path, output_path, fields_dict, external_data, model_name, steps=[], batch_size=10, max_workers=4):
+
+def enrich_table(csv_path, output_path, fields_dict, external_data, model_name, steps=[], batch_size=10, max_workers=4,
+                 max_content_chars=None):
     """
     Updates a CSV file with new contact information obtained via an API in batches,
     saving after each batch to ensure progress is not lost on failure.
@@ -25,76 +37,117 @@ def enrich_table(csv_path, output_path, fields_dict, external_data, model_name,
         batch_size (int): The number of rows in each processing batch.
         max_workers (int): The maximum number of threads to use for parallel processing.
         steps (list): List of steps, where each step is a dict containing 'function' and 'params'.
+        max_content_chars (int): The maximum number of characters of scraped URL content included
+            in each prompt. None sends the content in full.
     """
+    configure_logging()
+
     # Load CSV data
     df = pd.read_csv(csv_path)
 
-    # Ensure all required columns exist
+    # Ensure all required columns exist, as object columns so they can hold the string results
     df = ensure_columns_exist(df, fields_dict)
+    fields = list(fields_dict.keys())
+    df[fields] = df[fields].astype(object)
+
+    # Build the parts of the prompt that do not change between rows once
+    prompt_sections = build_prompt_sections(fields_dict)
+
+    # Process data in batches, sharing one thread pool across the whole run. The next batch
+    # is submitted before the current one is collected so its API calls overlap with saving.
+    # Output is streamed through a single buffered CSV writer that is opened once for the run.
+    with open(output_path, 'w', newline='', encoding='utf-8', buffering=1024 * 1024) as output_file, \
+            ThreadPoolExecutor(max_workers=max_workers) as executor:
+        writer = csv.writer(output_file, lineterminator='\n')
+        writer.writerow(df.columns)
 
-    # Process data in batches
-    for start in range(0, df.shape[0], batch_size):
-        end = start + batch_size
-        batch = df[start:end]
+        pending = submit_batch(executor, df, 0, batch_size, fields_dict, external_data, model_name, steps,
+                               max_content_chars, prompt_sections)
 
-        results = []
+        for start in range(0, df.shape[0], batch_size):
+            end = start + batch_size
+
+            futures = pending
+            if end < df.shape[0]:
+                pending = submit_batch(executor, df, end, batch_size, fields_dict, external_data, model_name, steps,
+                                       max_content_chars, prompt_sections)
+
+            results = {}
 
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = {
-                executor.submit(apply_enrichment_steps, row, fields_dict, external_data, model_name, steps): idx
-                for idx, row in batch.iterrows()
-            }
             for future in as_completed(futures):
                 idx = futures[future]
                 try:
-                    result = future.result()
-                    results.append((idx, result))
+                    results[idx] = dict(future.result())
                 except Exception as e:
                     logging.error(f"Error processing row {idx}: {e}")
-                    results.append((idx, pd.Series({field: None for field in fields_dict.keys()})))
-
-        # Update the batch with results
-        for idx, result in results:
-            if idx not in batch.index:
-                continue
-            for field, value in result.items():
-                if field not in batch.columns:
-                    batch[field] = None  # Add new field if it does not exist
-                # Ensure value is a string
-                if isinstance(value, list):
-                    value = convert_list_to_string(value)
-                else:
-                    value = str(value)
-                try:
-                    batch.at[idx, field] = value
-                except Exception as e:
-                    logging.error(f"Failed to update index {idx}, field '{field}' with value '{value}': {e}")
+                    results[idx] = {field: None for field in fields}
 
-        # Save the processed batch back to CSV incrementally
-        if start == 0:
-            batch.to_csv(output_path, mode='w', index=False, header=True)  # Write header only in first batch
-        else:
-            batch.to_csv(output_path, mode='a', index=False, header=False)  # Append without header for subsequent batches
+            # Update the batch with results in a single bulk assignment, with every value as a string
+            if results:
+                results_df = pd.DataFrame.from_dict(results, orient='index').reindex(columns=fields)
+                results_df = results_df.map(convert_value_to_string)
+                df.loc[results_df.index, results_df.columns] = results_df.values
+
+            # Save the processed batch back to CSV incrementally, writing missing values as empty cells
+            batch = df.iloc[start:end].astype(object)
+            batch = batch.where(batch.notna(), None)
+            writer.writerows(batch.itertuples(index=False, name=None))
+            output_file.flush()
 
-        logging.info(f"Processed batch from {start} to {end - 1}. Data saved to {output_path}")
+            logging.info(f"Processed batch from {start} to {end - 1}. Data saved to {output_path}")
 
     logging.info("All data has been processed and saved.")
 
 
-def apply_enrichment_steps(row, fields_dict, external_data, model_name, steps):
+def submit_batch(executor, df, start, batch_size, fields_dict, external_data, model_name, steps, max_content_chars=None,
+                 prompt_sections=None):
+    """
+    Submit the rows of one batch to the executor.
+
+    Parameters:
+        executor (ThreadPoolExecutor): The shared executor used for the whole run.
+        df (pd.DataFrame): The DataFrame being enriched.
+        start (int): Position of the first row of the batch.
+        batch_size (int): The number of rows in each processing batch.
+        fields_dict (dict): Dictionary of fields and their descriptions.
+        external_data (dict): Additional external data required for generating the prompt.
+        model_name (str): Model identifier for the API call.
+        steps (list): List of steps, where each step is a dict containing 'function' and 'params'.
+        max_content_chars (int): The maximum number of characters of URL content in the prompt.
+        prompt_sections (tuple): The static prompt sections from build_prompt_sections.
+
+    Returns:
+        dict: Mapping of each submitted future to the index of its row.
     """
-    Apply enrichment steps to a row.
+    batch = df[start:start + batch_size]
+    # Rows are passed as plain dicts, which are much cheaper to build than a Series per row
+    return {
+        executor.submit(apply_enrichment_steps, row, fields_dict, external_data, model_name, steps,
+                        max_content_chars, prompt_sections): idx
+        for idx, row in zip(batch.index, batch.to_dict(orient='records'))
+    }
+
+
+def apply_enrichment_steps(row, fields_dict, external_data, model_name, steps, max_content_chars=None,
+                           prompt_sections=None):
+    """
+    Apply enrichment steps to a row. The steps write to a copy of external_data, so rows processed
+    concurrently never see each other's step results.
 
     Parameters:
-        row (pd.Series): DataFrame row containing contact information.
+        row (dict): DataFrame row containing contact information, keyed by column name.
         fields_dict (dict): Dictionary of fields and their descriptions.
         external_data (dict): Additional external data required for generating the prompt.
         model_name (str): Model identifier for the API call.
         steps (list): List of steps, where each step is a dict containing 'function' and 'params'.
+        max_content_chars (int): The maximum number of characters of URL content in the prompt.
+        prompt_sections (tuple): The static prompt sections from build_prompt_sections.
 
     Returns:
-        pd.Series: A pandas Series with processed API response fields.
+        dict: The processed API response fields.
     """
+    external_data = dict(external_data)
+
     for step in steps:
         function = step['function']
         params = {}
@@ -105,7 +158,7 @@ def apply_enrichment_steps(row, fields_dict, external_data, model_name, steps):
                     # Evaluate the field expression to get the value from the row
                     params[param_name] = eval(field_expression)
                 except Exception as e:
-                    logging.error(f"Error evaluating field expression '{field_expression}' for row {row.name}: {e}")
+                    logging.error(f"Error evaluating field expression '{field_expression}': {e}")
                     params[param_name] = None  # Default to None if there's an error
             else:
                 # If it's not a row field expression, use it as a static value
@@ -115,53 +168,126 @@ def apply_enrichment_steps(row, fields_dict, external_data, model_name, steps):
         function(external_data=external_data, **params)
 
     # Process the row using the updated external data
-    return process_row(row, fields_dict, external_data, model_name)
+    return process_row(row, fields_dict, external_data, model_name, max_content_chars, prompt_sections)
+
+
+@functools.lru_cache(maxsize=8)
+def get_model(model_name):
+    """
+    Get the model object for a model name, creating it once and reusing it for every row.
+
+    Parameters:
+        model_name (str): Model identifier for the API call.
+
+    Returns:
+        GenerativeModel: The model object.
+    """
+    return genai.GenerativeModel(model_name=model_name)
+
+
+def get_response_json(model_name, prompt):
+    """
+    Get the JSON objects in the model's response to a prompt, calling the API only once for identical prompts.
+
+    Parsed responses are kept in a bounded LRU cache, and a prompt that is already being sent by another
+    thread waits for that request instead of issuing its own.
+
+    Parameters:
+        model_name (str): Model identifier for the API call.
+        prompt (str): The prompt to send to the model.
 
+    Returns:
+        list: The JSON objects extracted from the model's response.
 
-def process_row(row, fields_dict, external_data, model_name):
+    Raises:
+        ValueError: If the response contains no valid JSON object.
+    """
+    key = hashlib.blake2b(f"{model_name}\n{prompt}".encode(), digest_size=16).hexdigest()
+
+    with _response_lock:
+        if key in _response_cache:
+            _response_cache.move_to_end(key)
+            return _response_cache[key]
+        future = _pending_responses.get(key)
+        if future is None:
+            future = _pending_responses[key] = Future()
+            is_owner = True
+        else:
+            is_owner = False
+
+    if not is_owner:
+        logging.info("Waiting for identical prompt already sent to Gemini")
+        return future.result()
+
+    try:
+        response_text = call_gemini(get_model(model_name), prompt).text
+        json_objects = extract_json(response_text)
+        if json_objects is None:
+            raise ValueError("No valid JSON object in Gemini response")
+    except Exception as e:
+        with _response_lock:
+            del _pending_responses[key]
+        future.set_exception(e)
+        raise
+
+    with _response_lock:
+        del _pending_responses[key]
+        _response_cache[key] = json_objects
+        if len(_response_cache) > RESPONSE_CACHE_SIZE:
+            _response_cache.popitem(last=False)
+    future.set_result(json_objects)
+    return json_objects
+
+
+def process_row(row, fields_dict, external_data, model_name, max_content_chars=None, prompt_sections=None):
     """
     Process a contact by generating a prompt and calling an API model.
 
     Parameters:
-        row (pd.Series): DataFrame row containing contact information.
+        row (dict): DataFrame row containing contact information, keyed by column name.
         fields_dict (dict): Dictionary of fields and their descriptions.
         external_data (dict): Additional external data required for generating the prompt.
         model_name (str): Model identifier for the API call.
+        max_content_chars (int): The maximum number of characters of URL content in the prompt.
+        prompt_sections (tuple): The static prompt sections from build_prompt_sections.
 
     Returns:
-        pd.Series: A pandas Series with processed API response fields.
+        dict: The processed API response fields.
     """
-    if pd.isna(row[list(fields_dict.keys())[-1]]):
+    fields = list(fields_dict.keys())
+
+    if pd.isna(row.get(fields[-1])):
         fields_empty = True
     else:
         fields_empty = False
 
     if fields_empty:
         try:
-            row_data = row.drop(list(fields_dict.keys()))
+            row_data = {column: value for column, value in row.items() if column not in fields_dict}
 
-            # Build prompt
-            prompt = build_prompt(fields_dict, row_data, external_data)
+            # Bound the scraped content sent with the prompt, without modifying the caller's dict
+            if max_content_chars is not None and 'URL Content' in external_data:
+                url_content = truncate_content(external_data['URL Content'], max_content_chars)
+                external_data = {**external_data, 'URL Content': url_content}
 
-            # Call the API model with the prompt
-            model = genai.GenerativeModel(model_name=model_name)
-            response = call_gemini(model, prompt)
+            # Build prompt
+            prompt = build_prompt(fields_dict, row_data, external_data, prompt_sections)
 
-            # Convert the Gemini response to JSON format
-            json_objects = extract_json(response.text)
-            json_response = json_objects[0]
+            # Call the API model with the prompt and convert the response to JSON format,
+            # reusing the response to any identical prompt
+            json_response = get_response_json(model_name, prompt)[0]
 
-            # Parse the API response into a pandas Series
-            field_values = pd.Series({field: json_response.get(field, '') for field in fields_dict.keys()})
+            # Parse the API response into the field values
+            field_values = {field: json_response.get(field, '') for field in fields}
             
-            logging.info(f"Processed: {row.iat[0]}")
+            logging.info(f"Processed: {next(iter(row.values()))}")
             return field_values
 
         except Exception as e:
             logging.error(f"Error in process_row: {e}")
-            field_values = pd.Series({field: '' for field in fields_dict.keys()})
+            field_values = {field: '' for field in fields}
             return field_values
         
     else:
         logging.info(f"Skipping already processed row for {row.get('Website')}")
-        return row[list(fields_dict.keys())]
+        return {field: row.get(field) for field in fields}
@@ -1,6 +1,9 @@
 import os
 import time
+import random
 import logging
+import threading
+from google.api_core import exceptions
 from google.generativeai import configure, list_models
 from .utils import create_json_blueprint
 from dotenv import load_dotenv
@@ -8,10 +11,17 @@ from dotenv import load_dotenv
 # Load environment variables from .env file
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Errors worth retrying: rate limits (429), server errors (5xx) and timeouts.
+# Any other error (e.g. InvalidArgument, PermissionDenied) is raised immediately.
+RETRYABLE_ERRORS = (exceptions.TooManyRequests, exceptions.ServerError, TimeoutError, ConnectionError)
+
+# Monotonic timestamp before which no request should be sent, shared by all threads
+# so that a rate limit seen by one worker pauses the others too.
+_cooldown_until = 0.0
+_cooldown_lock = threading.Lock()
+
 
 def configure_gemini_api():
     api_key = os.getenv('GOOGLE_API_KEY')
@@ -33,47 +43,112 @@ def available_models():
     return models
 
 
-def build_prompt(fields_dict, row_data, external_data):
+def build_prompt_sections(fields_dict):
     """
-    Build the prompt for the API call.
+    Build the parts of the prompt that are the same for every row, so they can be built once per run.
 
     Parameters:
         fields_dict (dict): Dictionary of fields and their descriptions.
-        row_data (pd.Series): DataFrame row data excluding fields to be updated.
-        external_data (dict): Additional external data required for generating the prompt.
 
     Returns:
-        str: The generated prompt.
+        tuple: The prompt text before the row data and the prompt text after the external data.
     """
-    prompt = f"""
+    head = f"""
     **Task:**
     Using the data provided below, generate the following fields for a row in a table, outputted as a JSON:
     {fields_dict}
 
     **Existing Row Data**
-    {row_data.to_dict()}
-
-    **External Data**
-    {external_data}
+    """
+    tail = f"""
 
     **Example Output (Success):**
     ```json
     {create_json_blueprint(list(fields_dict.keys()))}
     ```
     """
+    return head, tail
+
+
+def build_prompt(fields_dict, row_data, external_data, prompt_sections=None):
+    """
+    Build the prompt for the API call.
+
+    Parameters:
+        fields_dict (dict): Dictionary of fields and their descriptions.
+        row_data (dict or pd.Series): DataFrame row data excluding fields to be updated.
+        external_data (dict): Additional external data required for generating the prompt.
+        prompt_sections (tuple): The static sections from build_prompt_sections. Built from
+            fields_dict when not given.
+
+    Returns:
+        str: The generated prompt.
+    """
+    head, tail = prompt_sections or build_prompt_sections(fields_dict)
+    prompt = f"""{head}{dict(row_data)}
+
+    **External Data**
+    {external_data}{tail}"""
     return prompt
 
 
-def call_gemini(model, prompt, max_retries=5, retry_delay=60):
+def get_retry_after(error):
+    """
+    Read the Retry-After header from an API error, if the server sent one.
+
+    Parameters:
+        error (Exception): The exception raised by the API call.
+
+    Returns:
+        float: The number of seconds to wait, or None if no usable header was found.
+    """
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    try:
+        return float(headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+def wait_for_cooldown():
+    """
+    Sleep until any active rate-limit cooldown has passed.
+    """
+    remaining = _cooldown_until - time.monotonic()
+    if remaining > 0:
+        logger.info(f"Rate limit cooldown active, waiting {remaining:.1f}s...")
+        time.sleep(remaining)
+
+
+def start_cooldown(seconds):
+    """
+    Hold back all requests for the given number of seconds.
+
+    Parameters:
+        seconds (float): Length of the cooldown.
+    """
+    global _cooldown_until
+    with _cooldown_lock:
+        _cooldown_until = max(_cooldown_until, time.monotonic() + seconds)
+
+
+def call_gemini(model, prompt, max_retries=5, base_delay=1.0, max_delay=30.0, jitter=0.5,
+                max_output_tokens=1024, timeout=120):
     """
     Calls a generative model to produce content based on a given prompt.
 
     This function sends a prompt to a pre-defined model and retrieves the generated content,
-    typically used for generating text based on input parameters.
+    typically used for generating text based on input parameters. Rate limits, server errors
+    and timeouts are retried with exponential backoff; other errors are raised immediately.
 
     Parameters:
         model (GenerativeModel): The model object capable of generating content.
         prompt (str): A string prompt that describes what content the model should generate.
+        max_retries (int): The maximum number of attempts before giving up.
+        base_delay (float): The delay in seconds before the first retry, doubled on each attempt.
+        max_delay (float): The upper bound in seconds for a single retry delay.
+        jitter (float): The maximum random delay in seconds added to each retry.
+        max_output_tokens (int): The maximum number of tokens the model may generate.
+        timeout (float): The timeout in seconds for a single request.
 
     Returns:
         response: The response from the model containing the generated content. The type of this
@@ -86,12 +161,21 @@ def call_gemini(model, prompt, max_retries=5, retry_delay=60):
         raise
 
     for attempt in range(max_retries):
+        wait_for_cooldown()
         try:
             logger.info("Calling Gemini...")
-            response = model.generate_content([prompt])
+            response = model.generate_content(
+                [prompt],
+                generation_config={'max_output_tokens': max_output_tokens, 'temperature': 0},
+                request_options={'timeout': timeout},
+            )
             return response
-        except Exception as e:
+        except RETRYABLE_ERRORS as e:
+            delay = min(base_delay * 2 ** attempt + random.uniform(0, jitter), max_delay)
             logger.error(f"Error: {e}, Attempt: {attempt + 1}")
-            time.sleep(retry_delay)
-    
+            if isinstance(e, exceptions.TooManyRequests):
+                start_cooldown(get_retry_after(e) or delay)
+            elif attempt + 1 < max_retries:
+                time.sleep(delay)
+
     raise Exception("API request failed after maximum retries")
\ No newline at end of file
@@ -3,7 +3,28 @@ import hashlib
 import base64
 
 
-def generate_unique_id(row, seed, fields, prefix="", length=16):
+def hash_to_id(unique_string, length=16, hash_name='blake2b'):
+    """
+    Hash a string and encode the digest as a URL-safe base64 ID.
+
+    Args:
+        unique_string (str): The string to hash.
+        length (int): Desired length of the ID (default is 16).
+        hash_name (str): The hashlib algorithm to use (default is 'blake2b').
+
+    Returns:
+        str: The encoded hash, truncated to the desired length.
+    """
+    if hash_name == 'blake2b':
+        # Request just enough digest bytes for the ID; base64 encodes every 3 bytes as 4 characters
+        digest_size = min(max(-(-length * 3 // 4), 1), 64)
+        hash_digest = hashlib.blake2b(unique_string.encode(), digest_size=digest_size).digest()
+    else:
+        hash_digest = hashlib.new(hash_name, unique_string.encode()).digest()
+    return base64.urlsafe_b64encode(hash_digest).decode('utf-8')[:length]
+
+
+def generate_unique_id(row, seed, fields, prefix="", length=16, hash_name='blake2b'):
     """
     Generate a unique ID for a given row based on specified fields and a seed.
 
@@ -12,48 +33,86 @@ def generate_unique_id(row, seed, fields, prefix="", length=16):
         seed (str): The seed string used to ensure deterministic ID generation.
         fields (list): List of fields to use for ID generation.
         length (int): Desired length of the generated ID (default is 16).
+        hash_name (str): The hashlib algorithm to use (default is 'blake2b').
 
     Returns:
         str: The generated unique ID with a prefix.
     """
     # Concatenate specified fields to create a unique string
     unique_string = ''.join(str(row[field]) for field in fields if pd.notna(row[field])) + seed
-    # Generate a hash of the unique string
-    hash_digest = hashlib.sha256(unique_string.encode()).digest()
-    # Encode the hash in base64 and truncate/pad to ensure consistent length
-    base64_encoded = base64.urlsafe_b64encode(hash_digest).decode('utf-8')[:length]
+    # Hash the unique string and encode it to an ID of consistent length
+    base64_encoded = hash_to_id(unique_string, length, hash_name)
     # Ensure the ID is prefixed with "CON"
     return f"{prefix}{base64_encoded}"
 
 
-def anonymize_rows(file_path, output_path, seed, personal_info_fields, id_fields, prefix=""):
+def generate_unique_ids(df, seed, fields, prefix="", length=16, hash_name='blake2b'):
+    """
+    Generate unique IDs for every row of a DataFrame, equivalent to calling
+    generate_unique_id on each row but without the per-row pandas overhead.
+
+    Args:
+        df (pd.DataFrame): The DataFrame to generate IDs for.
+        seed (str): The seed string used to ensure deterministic ID generation.
+        fields (list): List of fields to use for ID generation.
+        prefix (str): Prefix for the generated IDs.
+        length (int): Desired length of the generated IDs (default is 16).
+        hash_name (str): The hashlib algorithm to use (default is 'blake2b').
+
+    Returns:
+        list: The generated unique IDs, in row order.
+    """
+    # Concatenate the specified fields column-wise, treating missing values as empty strings
+    parts = [df[field].astype(str).where(df[field].notna(), '') for field in fields]
+    unique_strings = parts[0].str.cat(parts[1:]) + seed if parts else pd.Series(seed, index=df.index)
+    # Hash each string in a tight loop, with no pandas dispatch per row
+    return [prefix + hash_to_id(unique_string, length, hash_name) for unique_string in unique_strings]
+
+
+def anonymize_rows(file_path, output_path, seed, personal_info_fields, id_fields, prefix="", hash_name='blake2b'):
     """
     Anonymize the row information in a CSV file by generating unique IDs and removing personal info fields.
 
+    Rows that already have an ID keep it. The input file is rewritten with the ID column added,
+    unless every row already has an ID.
+
     Args:
         file_path (str): Path to the input CSV file containing contact information.
         output_path (str): Path to the output CSV file to save anonymized contact information.
         seed (str): The seed string used to ensure deterministic ID generation.
         personal_info_fields (list): List of fields containing personal information to be removed.
         id_fields (list): List of fields to use for generating unique IDs.
+        hash_name (str): The hashlib algorithm to use for new IDs (default is 'blake2b').
 
     Returns:
-        None
+        pd.DataFrame: The anonymized data, so callers can use it without reading output_path again.
     """
     # Read the CSV file
     df = pd.read_csv(file_path)
     
-    # Generate unique ID for each contact
-    df['ID'] = df.apply(lambda row: generate_unique_id(row, seed, id_fields, prefix), axis=1)
-    
-    # Save the original DataFrame with IDs to a new CSV file
-    df.to_csv(file_path, index=False)
+    # Generate unique ID for each contact. IDs already in the file are kept, so files anonymized
+    # earlier, possibly with a different hash, still match; only rows without an ID get a new one.
+    if 'ID' in df.columns:
+        missing = df['ID'].isna()
+        ids_unchanged = not missing.any()
+        if not ids_unchanged:
+            df['ID'] = df['ID'].astype(object)
+            df.loc[missing, 'ID'] = generate_unique_ids(df[missing], seed, id_fields, prefix, hash_name=hash_name)
+    else:
+        df['ID'] = generate_unique_ids(df, seed, id_fields, prefix, hash_name=hash_name)
+        ids_unchanged = False
     
     # Remove personal information fields
     df_anonymized = df.drop(columns=personal_info_fields)
     
-    # Save the modified DataFrame to a new CSV file
+    # Save the anonymized data to a new CSV file
     df_anonymized.to_csv(output_path, index=False)
+    
+    # Save the original data with IDs back to the input file, if any row was given a new ID
+    if not ids_unchanged:
+        df.to_csv(file_path, index=False)
+    
+    return df_anonymized
 
 
 def de_anonymize_rows(original_path, anonymized_path, output_path, personal_info_fields, id_field='ID'):
@@ -1,41 +1,127 @@
 import re
+import time
 import requests
 import logging
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlparse
 from bs4 import BeautifulSoup, element
-from bs4.element import Comment
 from typing import Union
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from usp.tree import sitemap_tree_for_homepage
+from usp.web_client.abstract_client import AbstractWebClient, RETRYABLE_HTTP_STATUS_CODES
+from usp.web_client.requests_client import RequestsWebClientSuccessResponse, RequestsWebClientErrorResponse
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-logging.CRITICAL
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3',
+    'Accept-Encoding': 'gzip, deflate',
+}
 
-def tag_visible(element):
+# (connect, read) timeouts in seconds for every request
+REQUEST_TIMEOUT = (5, 30)
+
+
+def create_session():
     """
-    Determines if a BeautifulSoup element is visible on the web page.
-    
-    Tags like 'style', 'script', 'head', 'title', 'meta', and '[document]'
-    are generally not visible, so this function returns False for these elements.
-    It also returns False for comment elements, which are not visible to users.
-    
-    Parameters:
-        element (bs4.element): A BeautifulSoup element to check for visibility.
-        
+    Create a requests session with pooled keep-alive connections and retries with backoff.
+
     Returns:
-        bool: True if the element is visible, False otherwise.
+        requests.Session: The configured session.
     """
-    if element.parent.name in ['style', 'script', 'head', 'title', 'meta', '[document]']:
-        return False
-    if isinstance(element, Comment):
-        return False
-    return True
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    retry = Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504], raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=32, pool_maxsize=64, max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+# Shared by all threads so connections to the same host are reused between fetches
+_session = create_session()
+
+# Per-host limits, so concurrent scraping does not trigger a site's own rate limiting
+HOST_MAX_CONNECTIONS = 4
+HOST_REQUESTS_PER_SECOND = 5
+
+# Host -> [semaphore capping concurrent requests, monotonic time of the latest scheduled request]
+_host_limits = {}
+_host_limits_lock = threading.Lock()
+
+
+@contextmanager
+def host_rate_limit(url):
+    """
+    Wait for a free request slot on the URL's host before sending a request.
+
+    At most HOST_MAX_CONNECTIONS requests run against a host at once, and request starts are
+    spaced at least 1 / HOST_REQUESTS_PER_SECOND seconds apart.
+
+    Parameters:
+        url (str): The URL about to be requested.
+    """
+    host = urlparse(url).netloc
+    with _host_limits_lock:
+        if host not in _host_limits:
+            _host_limits[host] = [threading.Semaphore(HOST_MAX_CONNECTIONS), 0.0]
+        host_limit = _host_limits[host]
+
+    with host_limit[0]:
+        # Reserve the next start time for this host, then sleep until it outside the lock
+        with _host_limits_lock:
+            now = time.monotonic()
+            start_at = max(now, host_limit[1] + 1 / HOST_REQUESTS_PER_SECOND)
+            host_limit[1] = start_at
+        time.sleep(start_at - now)
+        yield
+
+
+class SessionWebClient(AbstractWebClient):
+    """
+    Sitemap web client that fetches through the shared session, so sitemap crawls reuse its connections.
+    """
+
+    def __init__(self, session=_session):
+        self.session = session
+        self.max_response_data_length = None
+
+    def set_max_response_data_length(self, max_response_data_length):
+        self.max_response_data_length = max_response_data_length
+
+    def get(self, url):
+        try:
+            with host_rate_limit(url):
+                response = self.session.get(url, timeout=REQUEST_TIMEOUT, stream=True)
+        except requests.exceptions.Timeout as e:
+            return RequestsWebClientErrorResponse(message=str(e), retryable=True)
+        except requests.RequestException as e:
+            return RequestsWebClientErrorResponse(message=str(e), retryable=False)
+
+        if 200 <= response.status_code < 300:
+            return RequestsWebClientSuccessResponse(
+                requests_response=response,
+                max_response_data_length=self.max_response_data_length,
+            )
+        return RequestsWebClientErrorResponse(
+            message=f"{response.status_code} {response.reason}",
+            retryable=response.status_code in RETRYABLE_HTTP_STATUS_CODES,
+        )
+
+
+HEADING_PATTERN = re.compile('^h[1-6]$')
+
+# Tags whose contents are never rendered on the page
+INVISIBLE_TAGS = frozenset({'style', 'script', 'head', 'title', 'meta', 'noscript', 'template'})
 
 
 def get_text_from_html(body: str) -> str:
     """
     Extracts visible text from HTML content.
     
-    This function uses BeautifulSoup to parse HTML and extracts text that is visible on the page,
-    skipping over tags and elements that are typically not visible (like scripts and styles).
+    This function uses BeautifulSoup with the lxml parser to parse HTML, removes the subtrees of tags
+    that are not visible (like scripts and styles) in a single pass, and then extracts the remaining text.
+    Comments are skipped by BeautifulSoup's string iteration.
     
     Parameters:
         body (str): HTML content as a string.
@@ -43,15 +129,15 @@ def get_text_from_html(body: str) -> str:
     Returns:
         str: A string containing all visible text from the HTML, concatenated and separated by spaces.
     """
-    soup = BeautifulSoup(body, 'html.parser')
-    texts = soup.findAll(string=True)
-    visible_texts = filter(tag_visible, texts)  
-    return " ".join(t.strip() for t in visible_texts if isinstance(t, str))
+    soup = BeautifulSoup(body, 'lxml')
+    for tag in soup(INVISIBLE_TAGS):
+        tag.decompose()
+    return " ".join(soup.stripped_strings)
 
 
 def fetch_html(url: str) -> Union[str, None]:
     """
-    Fetches the HTML content from a given URL.
+    Fetches the HTML content from a given URL, using the shared session and per-host rate limit.
     
     Parameters:
         url (str): The URL of the webpage to fetch.
@@ -59,11 +145,9 @@ def fetch_html(url: str) -> Union[str, None]:
     Returns:
         Union[str, None]: The HTML content of the page, or None if an error occurred.
     """
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'}
-    
     try:
-        response = requests.get(url, headers=headers)
+        with host_rate_limit(url):
+            response = _session.get(url, timeout=REQUEST_TIMEOUT)
         response.raise_for_status()
         return response.text
     except requests.RequestException as e:
@@ -102,7 +186,7 @@ def get_pages_from_sitemap(domain_url):
     """
     raw_page_list = []
 
-    tree = sitemap_tree_for_homepage(domain_url)
+    tree = sitemap_tree_for_homepage(domain_url, web_client=SessionWebClient())
     for page in tree.all_pages():
         raw_page_list.append(page.url)
 
@@ -155,11 +239,12 @@ def print_heading_structure(url):
     print_heading_structure('https://example.com')
     """
     # Fetch the HTML content of the URL
-    response = requests.get(url)
+    with host_rate_limit(url):
+        response = _session.get(url, timeout=REQUEST_TIMEOUT)
     soup = BeautifulSoup(response.content, 'html.parser')
     
     # Find all heading tags
-    headings = soup.find_all(re.compile('^h[1-6]$'))
+    headings = soup.find_all(HEADING_PATTERN)
     
     # Create a structure to hold heading levels
     heading_structure = []
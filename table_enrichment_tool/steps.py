@@ -1,15 +1,34 @@
 import logging
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from .scraper import get_text_content, get_unique_page_list
 from .utils import extract_text_from_pdf
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-logging.CRITICAL
+# Maximum number of URLs fetched at once for a single row
+MAX_SCRAPE_WORKERS = 16
+
+
+def fetch_url_content(url):
+    """
+    Fetch the visible text of a single URL, returning an empty string on error.
+
+    Parameters:
+        url (str): The URL to fetch content from.
+
+    Returns:
+        str: The visible text of the page.
+    """
+    try:
+        return get_text_content(url) or ''
+    except Exception as e:
+        logging.error(f"Error scraping URL content for URL {url}: {e}")
+        return ''  # Empty string on error
+
 
 def scrape_url_content(external_data, urls):
     """
     Scrape content from the URL(s) provided and add it to the external data dictionary.
-    Handles both single URL and list of URLs.
+    Handles both single URL and list of URLs; a list is fetched concurrently, keeping its order.
 
     Parameters:
         external_data (dict): Dictionary to store external data.
@@ -17,14 +36,8 @@ def scrape_url_content(external_data, urls):
     """
     try:
         if isinstance(urls, list):
-            content_list = []
-            for url in urls:
-                try:
-                    content = get_text_content(url)
-                    content_list.append(content)
-                except Exception as e:
-                    logging.error(f"Error scraping URL content for URL {url}: {e}")
-                    content_list.append('')  # Append empty string on error
+            with ThreadPoolExecutor(max_workers=max(1, min(MAX_SCRAPE_WORKERS, len(urls)))) as executor:
+                content_list = list(executor.map(fetch_url_content, urls))
             external_data['URL Content'] = content_list
         
         else:
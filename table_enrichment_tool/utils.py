@@ -1,13 +1,40 @@
 import re
+import csv
 import json
 import textwrap
+import functools
+import itertools
 import logging
 import pandas as pd
 import fitz  # PyMuPDF
 from IPython.display import Markdown
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    # orjson parses considerably faster than the standard library; json is used when it is not installed
+    from orjson import loads as json_loads, JSONDecodeError
+except ImportError:
+    from json import loads as json_loads, JSONDecodeError
+
+# The bytes that change the state of the JSON block scanner
+JSON_TOKEN_PATTERN = re.compile(rb'[{}"\\]')
+
+# Plain text extraction only; image and annotation content is never collected
+PDF_TEXT_FLAGS = fitz.TEXTFLAGS_TEXT & ~fitz.TEXT_PRESERVE_IMAGES
+
+# Minimum number of pages per worker process, so short PDFs are read in-process
+PDF_PAGES_PER_WORKER = 64
+
+
+def configure_logging(level=logging.INFO):
+    """
+    Configure logging for the tool, unless the application has already configured it.
+
+    Parameters:
+    level (int, optional): The logging level. Defaults to logging.INFO.
+    """
+    logging.basicConfig(level=level, format='%(asctime)s - %(levelname)s - %(message)s')
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-logging.CRITICAL
 
 def ensure_columns_exist(df, fields_dict):
     """
@@ -20,9 +47,10 @@ def ensure_columns_exist(df, fields_dict):
     Returns:
     pandas.DataFrame: The modified DataFrame with the specified columns added if they didn't already exist.
     """
-    for field in fields_dict.keys():
-        if field not in df.columns:
-            df[field] = None
+    # Add all missing columns in one assignment, and leave the DataFrame untouched when none are missing
+    missing = [field for field in fields_dict.keys() if field not in df.columns]
+    if missing:
+        df[missing] = None
     return df
 
 
@@ -48,7 +76,56 @@ def convert_list_to_string(value_list):
     Returns:
     str: A comma-separated string of the list values.
     """
-    return ', '.join(map(str, value_list))
+    try:
+        # Lists of strings, the usual case, can be joined without converting each value
+        return ', '.join(value_list)
+    except TypeError:
+        return ', '.join(map(str, value_list))
+
+
+def convert_value_to_string(value):
+    """
+    Convert an API response value to the string stored in the table.
+    
+    Parameters:
+    value: The value to convert. Lists become comma-separated strings and missing values empty strings.
+    
+    Returns:
+    str: The string representation of the value.
+    """
+    if isinstance(value, list):
+        return convert_list_to_string(value)
+    if pd.isna(value):
+        return ''
+    return str(value)
+
+
+def truncate_content(content, max_chars):
+    """
+    Truncate text content to a maximum number of characters.
+
+    Parameters:
+    content (str or list): The text, or list of texts, to truncate. For a list the limit
+        applies to the combined length of its items.
+    max_chars (int): The maximum number of characters to keep. None disables truncation.
+
+    Returns:
+    str or list: The truncated content, in the same form as the input.
+    """
+    if max_chars is None:
+        return content
+    if isinstance(content, list):
+        truncated = []
+        remaining = max_chars
+        for item in content:
+            if isinstance(item, str):
+                item = item[:remaining]
+                remaining -= len(item)
+            truncated.append(item)
+        return truncated
+    if isinstance(content, str):
+        return content[:max_chars]
+    return content
 
 
 def to_markdown(text):
@@ -62,7 +139,8 @@ def to_markdown(text):
     IPython.display.Markdown: The converted markdown text.
     """
     text = text.replace('•', '  *')
-    return Markdown(textwrap.indent(text, '> ', predicate=lambda _: True))
+    # Quote every line, including blank ones, splitting on the same line breaks as textwrap.indent
+    return Markdown(''.join('> ' + line for line in text.splitlines(True)))
 
 
 def create_json_blueprint(fields):
@@ -72,6 +150,20 @@ def create_json_blueprint(fields):
     Parameters:
         fields (list): A list of field names to be used as keys in the JSON blueprint.
 
+    Returns:
+        str: A JSON-formatted string representing the blueprint.
+    """
+    return json_blueprint(tuple(fields))
+
+
+@functools.lru_cache(maxsize=128)
+def json_blueprint(fields):
+    """
+    Build the JSON blueprint for a tuple of fields, caching the result for repeated calls.
+
+    Parameters:
+        fields (tuple): The field names to be used as keys in the JSON blueprint.
+
     Returns:
         str: A JSON-formatted string representing the blueprint.
     """
@@ -79,35 +171,61 @@ def create_json_blueprint(fields):
     return json.dumps(blueprint_dict, indent=2)
 
 
-def extend_search(text, span):
+def iter_json_spans(buf):
     """
-    Extend the search to capture nested JSON structures.
+    Find the top-level balanced {...} blocks in UTF-8 encoded text in a single left-to-right pass.
+
+    Braces inside JSON strings are ignored, so string values containing braces do not end a block early.
+    If a block is never closed, the blocks that closed directly inside it are found instead, with no
+    second pass over the text. Only the structural bytes are visited, found by a compiled pattern,
+    so ordinary text is skipped at C speed.
 
     Parameters:
-    text (str): The text to search within.
-    span (tuple): A tuple containing the start and end indices of the initial match.
+    buf (bytes): The UTF-8 encoded text to scan.
 
-    Returns:
-    str: The extended JSON string from the start index to the closing brace of the nested structure.
+    Yields:
+    tuple: The start and end byte offsets of each block, so that buf[start:end] is the block.
     """
-    start, end = span
-    nest_count = 0
-    for i in range(start, len(text)):
-        if text[i] == '{':
-            nest_count += 1
-        elif text[i] == '}':
-            nest_count -= 1
-            if nest_count == 0:
-                return text[start:i+1]
-    return text[start:end]
+    # Each open block, outermost first, as its start offset and the spans of the blocks closed directly inside it
+    open_blocks = []
+    in_string = False
+    escaped_until = 0
+
+    for match in JSON_TOKEN_PATTERN.finditer(buf):
+        i = match.start()
+        byte = buf[i]
+        if in_string:
+            if i < escaped_until:
+                continue  # Escaped by the preceding backslash
+            if byte == 92:  # Backslash
+                escaped_until = i + 2
+            elif byte == 34:  # Double quote
+                in_string = False
+        elif byte == 34:
+            # Quotes only start a string inside a block, not in the surrounding prose
+            in_string = bool(open_blocks)
+        elif byte == 123:  # Opening brace
+            open_blocks.append((i, []))
+        elif byte == 125 and open_blocks:  # Closing brace
+            start, _ = open_blocks.pop()
+            if open_blocks:
+                open_blocks[-1][1].append((start, i + 1))
+            else:
+                yield start, i + 1
+
+    # Blocks left open never close, so the blocks closed directly inside them are the top-level ones.
+    # Each open block starts after every block closed inside the blocks around it, so order is kept.
+    for _, closed_spans in open_blocks:
+        yield from closed_spans
 
 
 def extract_json(text_response):
     """
     Extract JSON objects from a text response.
 
-    The function searches for strings that start with '{' and end with '}', 
-    attempts to parse them as JSON, and extends the search for nested structures if needed.
+    The function finds each top-level balanced {...} block with a single scan of the text and
+    parses it as JSON. When a block is not valid JSON, the objects nested inside it are tried instead.
+    The text is encoded to UTF-8 once, and both the scan and the parser work on the encoded bytes.
 
     Parameters:
     text_response (str): The text containing potential JSON strings.
@@ -115,25 +233,35 @@ def extract_json(text_response):
     Returns:
     list: A list of extracted JSON objects. Returns None if no valid JSON objects are found.
     """
-    pattern = r'\{[^{}]*\}'
-    matches = re.finditer(pattern, text_response)
+    return extract_json_from_bytes(text_response.encode('utf-8'))
+
+
+def extract_json_from_bytes(buf):
+    """
+    Extract JSON objects from UTF-8 encoded text.
+
+    Multi-byte UTF-8 sequences never contain the ASCII structural characters, so the blocks can be
+    found byte by byte and parsed straight from byte slices, without decoding back to str.
+
+    Parameters:
+    buf (bytes): The UTF-8 encoded text containing potential JSON strings.
+
+    Returns:
+    list: A list of extracted JSON objects. Returns None if no valid JSON objects are found.
+    """
     json_objects = []
-    
-    for match in matches:
-        json_str = match.group(0)
+
+    # Blocks still to be parsed, last block first, so objects are returned in the order they appear.
+    # Invalid blocks push the blocks nested inside them instead of recursing, so deep nesting is safe.
+    pending = find_json_blocks(buf)[::-1]
+
+    while pending:
+        block = pending.pop()
         try:
-            # Validate if the extracted string is valid JSON
-            json_obj = json.loads(json_str)
-            json_objects.append(json_obj)
-        except json.JSONDecodeError:
-            # Extend the search for nested structures
-            extended_json_str = extend_search(text_response, match.span())
-            try:
-                json_obj = json.loads(extended_json_str)
-                json_objects.append(json_obj)
-            except json.JSONDecodeError:
-                # Handle cases where the extraction is not valid JSON
-                continue
+            json_objects.append(parse_json(block))
+        except (json.JSONDecodeError, RecursionError):
+            # Look for valid objects nested inside the invalid block
+            pending.extend(find_json_blocks(block[1:-1])[::-1])
 
     if json_objects:
         return json_objects
@@ -141,28 +269,111 @@ def extract_json(text_response):
         return None
 
 
-def extract_text_from_pdf(file_path):
+def parse_json(data):
+    """
+    Parse a JSON document with orjson, falling back to the standard library.
+
+    orjson rejects the NaN, Infinity and -Infinity literals that json.loads accepts, so any
+    document orjson rejects is parsed again with json.loads.
+
+    Parameters:
+    data (bytes): The UTF-8 encoded JSON document.
+
+    Returns:
+    object: The parsed JSON value.
+    """
+    try:
+        return json_loads(data)
+    except JSONDecodeError:
+        if json_loads is json.loads:
+            raise
+        return json.loads(data)
+
+
+def find_json_blocks(buf):
+    """
+    Find the top-level balanced {...} blocks in UTF-8 encoded text.
+
+    Parameters:
+    buf (bytes): The UTF-8 encoded text to scan.
+
+    Returns:
+    list: The byte slices of buf holding each block, in order.
+    """
+    return [buf[start:end] for start, end in iter_json_spans(buf)]
+
+
+def extract_text_pages(file_path, start=0, stop=None):
+    """
+    Yields the text of each page of a PDF file in turn.
+
+    Callers can start processing early pages while later ones are still unread, or stop early
+    (e.g. with itertools.islice) without extracting the rest of the document.
+
+    Parameters:
+        file_path (str): The file path to the PDF file.
+        start (int): Index of the first page to extract.
+        stop (int): Index one past the last page to extract. Defaults to the end of the document.
+
+    Yields:
+        str: The text of each page.
+    """
+    with fitz.open(file_path) as document:
+        page_count = document.page_count
+        stop = page_count if stop is None else min(stop, page_count)
+        for page_num in range(start, stop):
+            yield document.load_page(page_num).get_text(flags=PDF_TEXT_FLAGS)
+
+
+def extract_text_from_pdf_pages(file_path, start, stop):
+    """
+    Extracts the text of a range of pages from a PDF file.
+
+    Parameters:
+        file_path (str): The file path to the PDF file.
+        start (int): Index of the first page to extract.
+        stop (int): Index one past the last page to extract.
+
+    Returns:
+        str: The extracted text of the pages.
+    """
+    return "".join(extract_text_pages(file_path, start, stop))
+
+
+def extract_text_from_pdf(file_path, max_workers=None):
     """
     Extracts all text from a PDF file.
 
+    Pages are read one after another in this process by default. Passing max_workers splits long
+    documents into contiguous page ranges that are extracted in parallel. PyMuPDF cannot be used
+    from several threads, so each range is read by a worker process that opens the file itself.
+    Starting the processes costs more than reading short documents, the calling script needs an
+    `if __name__ == '__main__':` guard on platforms that spawn processes, and the option should not
+    be used from inside a thread pool.
+
     Parameters:
         file_path (str): The file path to the PDF file.
+        max_workers (int): The maximum number of worker processes. None reads the file serially.
 
     Returns:
         str: The extracted text from the PDF.
     """
     try:
-        # Open the PDF file
-        document = fitz.open(file_path)
-        # Initialize text variable
-        text = ""
-        # Iterate through each page
-        for page_num in range(len(document)):
-            # Get the page
-            page = document.load_page(page_num)
-            # Extract text from the page
-            text += page.get_text()
-        return text
+        if not max_workers or max_workers <= 1:
+            return "".join(extract_text_pages(file_path))
+
+        # Open the PDF file only to count its pages
+        with fitz.open(file_path) as document:
+            page_count = document.page_count
+        workers = min(max_workers, page_count // PDF_PAGES_PER_WORKER)
+
+        if workers <= 1:
+            return "".join(extract_text_pages(file_path))
+
+        bounds = [page_count * i // workers for i in range(workers + 1)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            parts = executor.map(extract_text_from_pdf_pages, [file_path] * workers, bounds[:-1], bounds[1:])
+            return "".join(parts)
     except Exception as e:
         logging.error(f"Error reading PDF file at {file_path}: {e}")
         return ""
@@ -172,6 +383,8 @@ def chunk_text(text, num_chunks):
     """
     Splits text into specified number of chunks.
 
+    Words are spread as evenly as possible, so chunk sizes differ by at most one word.
+
     Parameters:
         text (str): The text to split.
         num_chunks (int): The number of chunks to split the text into.
@@ -181,16 +394,11 @@ def chunk_text(text, num_chunks):
     """
     # Split the text into words
     words = text.split()
-    # Calculate the approximate number of words per chunk
-    chunk_size = len(words) // num_chunks
-    # Create the list of chunks
-    chunks = [' '.join(words[i * chunk_size: (i + 1) * chunk_size]) for i in range(num_chunks)]
-    
-    # Handle any remaining words by appending them to the last chunk
-    if len(words) % num_chunks != 0:
-        chunks[-1] += ' ' + ' '.join(words[num_chunks * chunk_size:])
-    
-    return chunks
+    # The first `remainder` chunks take one extra word each
+    chunk_size, remainder = divmod(len(words), num_chunks)
+    ends = list(itertools.accumulate(chunk_size + (i < remainder) for i in range(num_chunks)))
+    # Create the list of chunks, joining each word exactly once
+    return [' '.join(words[start:end]) for start, end in zip([0] + ends[:-1], ends)]
 
 
 def save_chunks_to_csv(chunks, output_path):
@@ -204,7 +412,8 @@ def save_chunks_to_csv(chunks, output_path):
     Returns:
         None
     """
-    # Create a DataFrame from the chunks
-    df = pd.DataFrame({'Text Chunk': chunks})
-    # Save the DataFrame to a CSV file
-    df.to_csv(output_path, index=False)
\ No newline at end of file
+    # Stream the chunks straight to the CSV file, one row each
+    with open(output_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(['Text Chunk'])
+        writer.writerows([chunk] for chunk in chunks)
\ No newline at end of file
@@ -0,0 +1,21 @@
+import time
+
+from table_enrichment_tool.utils import extract_json
+
+
+def test_extract_json_finds_objects_inside_unclosed_blocks():
+    assert extract_json('{ {"a": 1} { {"b": {"c": 2}}') == [{'a': 1}, {'b': {'c': 2}}]
+
+
+def test_extract_json_scans_unbalanced_input_in_linear_time():
+    # These took seconds each when every unclosed brace restarted the scan
+    for text in ['{' * 8000, '{"a": "' * 4000]:
+        start = time.perf_counter()
+        assert extract_json(text) is None
+        assert time.perf_counter() - start < 1
+
+
+def test_extract_json_accepts_non_finite_numbers():
+    objects = extract_json('{"a": NaN, "b": Infinity}')
+    assert len(objects) == 1
+    assert objects[0]['a'] != objects[0]['a'] and objects[0]['b'] == float('inf')